@@ -0,0 +1,57 @@
+"""One-shot bootstrap for States_and_Districts.json.
+
+The API never geocodes districts at runtime — the heatmap loop iterates the
+pre-resolved coordinates file. If that file is missing (or new districts need
+adding), run this script with a list of place names, one per line:
+
+    python bootstrap_districts.py districts.txt
+
+Lookups go through Nominatim at most once per second, per their usage policy.
+"""
+import json, os, sys, time, requests
+
+DISTRICTS_FILE = "States_and_Districts.json"
+
+def geocode(place):
+    res = requests.get(
+        "https://nominatim.openstreetmap.org/search",
+        params={"q": f"{place}, India", "format": "json", "limit": 1},
+        headers={"User-Agent": "aqi-backend-bootstrap"},
+        timeout=10,
+    )
+    res.raise_for_status()
+    data = res.json()
+    return (float(data[0]["lat"]), float(data[0]["lon"])) if data else None
+
+def main(names_file):
+    coords = {}
+    if os.path.exists(DISTRICTS_FILE):
+        with open(DISTRICTS_FILE, "r", encoding="utf-8") as f:
+            coords = json.load(f)
+
+    with open(names_file, "r", encoding="utf-8") as f:
+        names = [line.strip() for line in f if line.strip()]
+
+    for name in names:
+        if name in coords:
+            continue
+        try:
+            result = geocode(name)
+        except Exception as e:
+            print(f"❌ {name}: {e}")
+            continue
+        if result:
+            coords[name] = list(result)
+            print(f"✅ {name}: {result}")
+        else:
+            print(f"⚠️ {name}: no match")
+        time.sleep(1)
+
+    with open(DISTRICTS_FILE, "w", encoding="utf-8") as f:
+        json.dump(coords, f, ensure_ascii=False, indent=2)
+    print(f"Saved {len(coords)} districts to {DISTRICTS_FILE}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(f"Usage: python {sys.argv[0]} <names-file>")
+    main(sys.argv[1])
@@ -1,20 +1,50 @@
-from fastapi import FastAPI, Query
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import requests, json, folium, time, os, asyncio, pandas as pd
-from datetime import datetime, date
-import google.generativeai as genai
+from fastapi.middleware.gzip import GZipMiddleware
+import os, asyncio, fcntl, httpx, time, random, hashlib, diskcache, orjson, gzip, numpy as np
+from aiolimiter import AsyncLimiter
+import pyarrow as pa, pyarrow.parquet as pq
+from datetime import date
+from email.utils import formatdate, parsedate_to_datetime
+from functools import lru_cache
 
 # -------------------- Config --------------------
 API_KEY = os.getenv("OWM_API_KEY", "fallback-openweather-key")
 GEMINI_KEY = os.getenv("GEMINI_API_KEY", "")
-genai.configure(api_key=GEMINI_KEY) if GEMINI_KEY else None
 
-HEATMAP_FILE    = "aqi_heatmap.html"
-DISTRICTS_FILE  = "States_and_Districts.json"
-HISTORICAL_CSV  = "aqi_history.csv"
+HEATMAP_FILE       = "heatmap.html"        # static Leaflet page, rendered client-side
+HEATMAP_DATA_FILE  = "heatmap_points.json"
+DISTRICTS_FILE     = "States_and_Districts.json"
+HISTORY_DIR        = "aqi_history"  # Parquet dataset, one file per refresh
+REFRESH_LOCK_FILE  = ".refresh.lock"
 
-app = FastAPI()
+# District coordinates are static — parse the JSON once at import instead of
+# re-reading the file on every refresh tick and /aqi request.
+if os.path.exists(DISTRICTS_FILE):
+    with open(DISTRICTS_FILE, "rb") as _f:
+        DISTRICT_COORDS = orjson.loads(_f.read())
+else:
+    print("⚠️ City JSON missing.")
+    DISTRICT_COORDS = {}
+
+# Struct-of-arrays view of the districts for vectorized coordinate queries:
+# nearest-district lookups become one NumPy pass instead of a Python loop.
+DISTRICT_NAMES = np.array(list(DISTRICT_COORDS.keys()))
+DISTRICT_LATS = np.radians(np.array([v[0] for v in DISTRICT_COORDS.values()], dtype=np.float32))
+DISTRICT_LONS = np.radians(np.array([v[1] for v in DISTRICT_COORDS.values()], dtype=np.float32))
+
+def nearest_district(lat, lon):
+    if not DISTRICT_NAMES.size:
+        return None
+    # Haversine numerator; monotonic with great-circle distance, so argmin
+    # needs no arcsin/sqrt.
+    qlat, qlon = np.radians(lat), np.radians(lon)
+    a = (np.sin((DISTRICT_LATS - qlat) / 2) ** 2
+         + np.cos(DISTRICT_LATS) * np.cos(qlat) * np.sin((DISTRICT_LONS - qlon) / 2) ** 2)
+    return str(DISTRICT_NAMES[int(np.argmin(a))])
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # -------------------- CORS --------------------
 app.add_middleware(
@@ -24,153 +54,439 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large text payloads (history CSV, big JSON bodies) on the fly; the
+# heatmap page is served pre-compressed from memory and skipped by this middleware.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# -------------------- HTTP client --------------------
+# One shared client so TCP+TLS handshakes are reused across all OWM calls.
+# Connect failures retry at the transport level before surfacing.
+# Note: with an explicit transport, httpx ignores client-level limits/http2,
+# so pool sizing and HTTP/2 must be configured on the transport itself.
+CLIENT = httpx.AsyncClient(
+    timeout=10,
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=64),
+        retries=3,
+    ),
+)
+FETCH_CONCURRENCY = 20
+
+# Token bucket sized to OWM's free tier (60 req/min): only blocks when the
+# budget is actually exhausted, unlike the old fixed 1 s sleep per district.
+OWM_LIMITER = AsyncLimiter(60, 60)
+
+# Single-flight guard: concurrent cold-start requests (and the hourly tick)
+# coalesce onto one running refresh instead of each triggering their own.
+REFRESH_LOCK = asyncio.Lock()
+
+# -------------------- Cache --------------------
+# AQI only changes ~hourly, so cache OWM responses on disk keyed by (lat, lon, hour).
+AQI_CACHE = diskcache.Cache("./cache/aqi")
+AQI_CACHE_TTL = 3600
+
+# Geocoding results are essentially static; keep them on disk for a day so
+# Nominatim (rate-limited to 1 req/s) is only hit for cities missing from the
+# districts file. The file itself is pre-seeded into the cache at startup.
+GEO_CACHE = diskcache.Cache("./cache/geo")
+GEO_CACHE_TTL = 86400
+
+# Semantic cache for Gemini advice: prompts cluster heavily (same city + AQI bucket),
+# so near-duplicate prompts are answered from Redis instead of a ~1 s LLM round trip.
+# Optional — enabled only when REDIS_URL is set and redisvl is installed.
+REDIS_URL = os.getenv("REDIS_URL", "")
+ADVICE_CACHE = None
+if REDIS_URL:
+    try:
+        from redisvl.extensions.cache.llm import SemanticCache
+        ADVICE_CACHE = SemanticCache(name="aqi_advice", redis_url=REDIS_URL, distance_threshold=0.1, ttl=86400)
+    except Exception as e:
+        print("⚠️ Semantic cache unavailable:", e)
+
+def _aqi_cache_key(lat, lon):
+    return f"aqi:{round(lat, 3)}:{round(lon, 3)}:{int(time.time() // 3600)}"
+
 # -------------------- Utility --------------------
-def get_aqi(lat, lon):
+async def get_aqi(lat, lon):
+    key = _aqi_cache_key(lat, lon)
+    cached = AQI_CACHE.get(key)
+    if cached is not None:
+        return cached
     url = f"https://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={API_KEY}"
     try:
-        res = requests.get(url, timeout=10)
+        tries = 3
+        for attempt in range(tries):
+            async with OWM_LIMITER:
+                res = await CLIENT.get(url)
+            if res.status_code != 429 and res.status_code < 500:
+                break
+            if attempt == tries - 1:
+                break
+            # Jittered exponential backoff; await keeps the loop serving
+            # other requests while this city waits out the limit.
+            await asyncio.sleep(min(2 ** attempt, 8) + random.uniform(0, 0.5))
         res.raise_for_status()
-        return res.json()["list"][0]["main"]["aqi"]
+        aqi = orjson.loads(res.content)["list"][0]["main"]["aqi"]
+        AQI_CACHE.set(key, aqi, expire=AQI_CACHE_TTL)
+        return aqi
     except Exception as e:
         print("❌ AQI fetch error:", e)
         return None
 
-def get_color(aqi):
-    return {1: "green", 2: "yellow", 3: "orange", 4: "red", 5: "purple"}.get(aqi, "gray")
+@lru_cache(maxsize=1)
+def _gemini_model():
+    # google.generativeai pulls in grpc and friends — only pay that import
+    # (and RSS) in processes that actually generate advice.
+    import google.generativeai as genai
+    genai.configure(api_key=GEMINI_KEY)
+    return genai.GenerativeModel("gemini-1.5-flash")
 
 def generate_health_advice(city, aqi_val):
     if not (GEMINI_KEY and aqi_val):
         return "No advice available."
+    return _advice_for_aqi(int(aqi_val))
+
+# Advice is really a function of the AQI level alone — five answers cover
+# every city, so the cache is keyed by level and pre-warmed at startup.
+@lru_cache(maxsize=8)
+def _advice_for_aqi(aqi_val):
+    prompt = f"The AQI level is {aqi_val} on a 1–5 scale (1=Good, 5=Very Poor). Give a short health tip with risk level and precautions in one sentence."
+    if ADVICE_CACHE:
+        try:
+            hit = ADVICE_CACHE.check(prompt=prompt)
+            if hit:
+                return hit[0]["response"]
+        except Exception as e:
+            print("⚠️ Semantic cache lookup failed:", e)
     try:
-        prompt = f"The AQI in {city} is {aqi_val}. Give a short health tip with risk level and precautions in one sentence."
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        return model.generate_content(prompt).text.strip()
+        advice = _gemini_model().generate_content(prompt).text.strip()
     except Exception as e:
         print("❌ Gemini error:", e)
         return "AQI available. Consider staying indoors if sensitive."
+    if ADVICE_CACHE:
+        try:
+            ADVICE_CACHE.store(prompt=prompt, response=advice)
+        except Exception as e:
+            print("⚠️ Semantic cache store failed:", e)
+    return advice
+
+async def get_coordinates(place):
+    key = place.lower().strip()
+    hit = GEO_CACHE.get(key)
+    if hit:
+        return hit
+    try:
+        res = await CLIENT.get(
+            "https://nominatim.openstreetmap.org/search",
+            params={"q": place, "format": "json", "limit": 1},
+            headers={"User-Agent": "aqi-backend"},
+        )
+        res.raise_for_status()
+        data = orjson.loads(res.content)
+        if data:
+            coords = (float(data[0]["lat"]), float(data[0]["lon"]))
+            GEO_CACHE.set(key, coords, expire=GEO_CACHE_TTL)
+            return coords
+    except Exception as e:
+        print("❌ Geocoding error:", e)
+    return None
+
+def _aqi_records(items):
+    # Epoch→ISO in one C-vectorized pass instead of a datetime object and
+    # .isoformat() call per row.
+    dts = np.fromiter((i["dt"] for i in items), dtype=np.int64, count=len(items))
+    iso = dts.astype("datetime64[s]").astype(str)
+    return [
+        {"datetime": dt, "aqi": i["main"]["aqi"]}
+        for dt, i in zip(iso.tolist(), items)
+    ]
+
+# History lives in a Parquet dataset: dictionary-encoded city ids, 4-byte
+# dates, and single-byte AQI values instead of ASCII text, and reads push the
+# city filter down so /aqi touches only that city's bytes.
+HISTORY_SCHEMA = pa.schema([
+    ("city", pa.dictionary(pa.int16(), pa.string())),
+    ("date", pa.date32()),
+    ("aqi", pa.uint8()),
+])
+
+def log_daily_aqi(rows):
+    # Single Parquet file per refresh instead of one open/write/close per district.
+    if not rows:
+        return
+    today = date.today()
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    table = pa.table({
+        "city": [city for city, _ in rows],
+        "date": [today] * len(rows),
+        "aqi": [aqi for _, aqi in rows],
+    }, schema=HISTORY_SCHEMA)
+    # Write under a dotted name (ignored by dataset scans) and rename into
+    # place so concurrent readers never see a partial file.
+    name = f"{today.isoformat()}-{time.time_ns()}.parquet"
+    tmp_path = os.path.join(HISTORY_DIR, f".{name}")
+    pq.write_table(table, tmp_path)
+    os.rename(tmp_path, os.path.join(HISTORY_DIR, name))
+
+def read_city_history(city, limit=30):
+    if not os.path.isdir(HISTORY_DIR):
+        return []
+    try:
+        table = pq.read_table(HISTORY_DIR, filters=[("city", "=", city)])
+    except Exception as e:
+        # An empty or unreadable dataset means no history yet, not a 500.
+        print("⚠️ History read failed:", e)
+        return []
+    return [
+        {"city": row["city"], "date": row["date"].isoformat(), "aqi": row["aqi"]}
+        for row in table.sort_by("date").to_pylist()[-limit:]
+    ]
+
+# The map itself is a static Leaflet page (heatmap.html) rendered in the
+# browser; the server only collects AQI points and dumps a few-KB JSON blob.
+# Only the refresh-lock holder regenerates; the other workers pick up each
+# refresh from the data file via the same mtime check /heatmap uses.
+HEATMAP_POINTS = {"points": [], "ts": None}
+_HEATMAP_DATA_MTIME = None
+
+def _reload_heatmap_points():
+    global _HEATMAP_DATA_MTIME
+    try:
+        mtime = os.path.getmtime(HEATMAP_DATA_FILE)
+    except OSError:
+        return
+    if mtime != _HEATMAP_DATA_MTIME:
+        with open(HEATMAP_DATA_FILE, "rb") as f:
+            HEATMAP_POINTS.update(orjson.loads(f.read()))
+        _HEATMAP_DATA_MTIME = mtime
 
-def log_daily_aqi(city, aqi):
-    today = date.today().isoformat()
-    with open(HISTORICAL_CSV, "a", encoding="utf-8") as f:
-        f.write(f"{city},{today},{aqi}\n")
+_reload_heatmap_points()
 
-def generate_heatmap():
-    if not os.path.exists(DISTRICTS_FILE):
+async def generate_heatmap():
+    if not DISTRICT_COORDS:
         print("⚠️ City JSON missing. Skipping heatmap.")
         return
 
-    with open(DISTRICTS_FILE, "r", encoding="utf-8") as f:
-        city_coords = json.load(f)
+    sem = asyncio.Semaphore(FETCH_CONCURRENCY)
 
-    m = folium.Map(location=[20.5937, 78.9629], zoom_start=5, tiles="CartoDB positron")
+    async def bounded_fetch(city, lat, lon):
+        async with sem:
+            return city, lat, lon, await get_aqi(lat, lon)
 
-    for city, (lat, lon) in city_coords.items():
-        aqi = get_aqi(lat, lon)
+    results = await asyncio.gather(
+        *[bounded_fetch(city, lat, lon) for city, (lat, lon) in DISTRICT_COORDS.items()]
+    )
+
+    history_rows = []
+    points = []
+    for city, lat, lon, aqi in results:
         if aqi:
-            color = get_color(aqi)
-            folium.CircleMarker(
-                [lat, lon], radius=6,
-                popup=f"{city} — AQI: {aqi}",
-                color=color, fill=True, fill_color=color, fill_opacity=0.7
-            ).add_to(m)
-            log_daily_aqi(city, aqi)
-        time.sleep(1)
-
-    legend = """<div style="position: fixed; bottom: 30px; left: 30px; width: 150px;
-    border:2px solid grey; background:white; padding:10px; z-index:9999;">
-    <b>AQI Legend</b><br>
-    <span style='background-color:green'>&nbsp;&nbsp;&nbsp;</span> Good (1)<br>
-    <span style='background-color:yellow'>&nbsp;&nbsp;&nbsp;</span> Fair (2)<br>
-    <span style='background-color:orange'>&nbsp;&nbsp;&nbsp;</span> Moderate (3)<br>
-    <span style='background-color:red'>&nbsp;&nbsp;&nbsp;</span> Poor (4)<br>
-    <span style='background-color:purple'>&nbsp;&nbsp;&nbsp;</span> Very Poor (5)
-    </div>"""
-    m.get_root().html.add_child(folium.Element(legend))
-    m.save(HEATMAP_FILE)
-    print("✅ Heatmap updated.")
+            points.append((city, lat, lon, aqi))
+            history_rows.append((city, aqi))
+
+    HEATMAP_POINTS["points"] = points
+    HEATMAP_POINTS["ts"] = int(time.time())
+
+    # Keep the event loop free of disk I/O while requests are being served.
+    def _persist():
+        global _HEATMAP_DATA_MTIME
+        log_daily_aqi(history_rows)
+        with open(HEATMAP_DATA_FILE, "wb") as f:
+            f.write(orjson.dumps(HEATMAP_POINTS))
+        _HEATMAP_DATA_MTIME = os.path.getmtime(HEATMAP_DATA_FILE)
+
+    await asyncio.to_thread(_persist)
+    print("✅ Heatmap data updated.")
 
 # -------------------- Background Task --------------------
+# Held for the process lifetime by whichever worker wins the refresh lock.
+_REFRESH_LOCK_FH = None
+
 @app.on_event("startup")
 async def refresh_loop():
+    # With multiple uvicorn workers, only the lock holder runs the hourly
+    # sweep — otherwise every worker would burn the same OWM quota (N× the
+    # token bucket) and append duplicate history rows each refresh.
+    global _REFRESH_LOCK_FH
+    _REFRESH_LOCK_FH = open(REFRESH_LOCK_FILE, "w")
+    try:
+        fcntl.flock(_REFRESH_LOCK_FH, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        _REFRESH_LOCK_FH.close()
+        _REFRESH_LOCK_FH = None
+        return
+
     async def loop():
         while True:
             print("🔁 Refreshing heatmap...")
-            generate_heatmap()
+            async with REFRESH_LOCK:
+                await generate_heatmap()
             await asyncio.sleep(3600)
     asyncio.create_task(loop())
 
+@app.on_event("startup")
+async def seed_geo_cache():
+    for city, (lat, lon) in DISTRICT_COORDS.items():
+        GEO_CACHE.set(city.lower().strip(), (lat, lon))
+
+@app.on_event("startup")
+async def prewarm_advice():
+    # Resolve all five advice strings up front so no request waits on Gemini.
+    if not GEMINI_KEY:
+        return
+    async def warm():
+        for level in range(1, 6):
+            await asyncio.to_thread(_advice_for_aqi, level)
+    asyncio.create_task(warm())
+
+@app.on_event("startup")
+async def advice_cache_expiry():
+    # Cached advice entries are cheap but should not outlive a day.
+    async def loop():
+        while True:
+            await asyncio.sleep(86400)
+            _advice_for_aqi.cache_clear()
+    asyncio.create_task(loop())
+
 # -------------------- Routes --------------------
 @app.get("/")
 def home():
     return {"message": "✅ AQI backend is running."}
 
+# Page bytes (plain + gzipped) and ETag cached in memory, refreshed only when
+# the file's mtime changes — repeat hits never touch the disk.
+_HEATMAP_CACHE = {"mtime": None, "etag": None, "plain": None, "gz": None}
+
 @app.get("/heatmap")
-def serve_heatmap():
-    if not os.path.exists(HEATMAP_FILE):
-        generate_heatmap()
-    return FileResponse(HEATMAP_FILE, media_type="text/html")
+async def serve_heatmap(request: Request):
+    mtime = int(os.path.getmtime(HEATMAP_FILE))
+    if _HEATMAP_CACHE["mtime"] != mtime:
+        with open(HEATMAP_FILE, "rb") as f:
+            body = f.read()
+        _HEATMAP_CACHE.update(
+            mtime=mtime,
+            etag=hashlib.md5(body).hexdigest(),
+            plain=body,
+            gz=gzip.compress(body, compresslevel=6),
+        )
+
+    etag = _HEATMAP_CACHE["etag"]
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            if int(parsedate_to_datetime(ims).timestamp()) >= mtime:
+                return Response(status_code=304, headers={"ETag": etag})
+        except (TypeError, ValueError):
+            pass
+
+    headers = {"ETag": etag, "Last-Modified": formatdate(mtime, usegmt=True)}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(_HEATMAP_CACHE["gz"], media_type="text/html", headers=headers)
+    return Response(_HEATMAP_CACHE["plain"], media_type="text/html", headers=headers)
+
+@app.get("/heatmap_data")
+async def heatmap_data():
+    await asyncio.to_thread(_reload_heatmap_points)
+    if not HEATMAP_POINTS["points"]:
+        if _REFRESH_LOCK_FH is not None:
+            async with REFRESH_LOCK:
+                if not HEATMAP_POINTS["points"]:
+                    await generate_heatmap()
+        else:
+            # Non-holders never regenerate (that would duplicate the OWM sweep
+            # and history rows); poll for the holder's data file instead.
+            for _ in range(60):
+                await asyncio.sleep(0.5)
+                await asyncio.to_thread(_reload_heatmap_points)
+                if HEATMAP_POINTS["points"]:
+                    break
+    return HEATMAP_POINTS
 
 @app.get("/aqi")
-def get_aqi_data(city: str = Query(...)):
+async def get_aqi_data(city: str = Query(...)):
     try:
-        with open(DISTRICTS_FILE, "r", encoding="utf-8") as f:
-            city_coords = json.load(f)
-        if city not in city_coords:
+        coords = DISTRICT_COORDS.get(city) or DISTRICT_COORDS.get(city.title()) or await get_coordinates(city)
+        if not coords:
             return JSONResponse(status_code=404, content={"error": "City not found"})
-        lat, lon = city_coords[city]
-
-        cur = requests.get(f"https://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={API_KEY}").json()
-        fc  = requests.get(f"https://api.openweathermap.org/data/2.5/air_pollution/forecast?lat={lat}&lon={lon}&appid={API_KEY}").json()
-
-        df_cur = pd.DataFrame([{
-            "datetime": datetime.utcfromtimestamp(i["dt"]).isoformat(),
-            "aqi": i["main"]["aqi"]
-        } for i in cur.get("list", [])])
-
-        df_fc = pd.DataFrame([{
-            "datetime": datetime.utcfromtimestamp(i["dt"]).isoformat(),
-            "aqi": i["main"]["aqi"]
-        } for i in fc.get("list", [])])
-        df_fc["date"] = pd.to_datetime(df_fc["datetime"]).dt.date
-        df_7d = df_fc.groupby("date")["aqi"].mean().reset_index().head(7)
-
-        # 30‑day history
-        if os.path.exists(HISTORICAL_CSV):
-            df_hist = pd.read_csv(HISTORICAL_CSV, names=["city", "date", "aqi"])
-            history = df_hist[df_hist["city"] == city].tail(30)
-        else:
-            history = pd.DataFrame(columns=["city", "date", "aqi"])
+        lat, lon = coords
 
-        latest = df_cur.iloc[-1]["aqi"] if not df_cur.empty else None
+        cur_res, fc_res = await asyncio.gather(
+            CLIENT.get(f"https://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={API_KEY}"),
+            CLIENT.get(f"https://api.openweathermap.org/data/2.5/air_pollution/forecast?lat={lat}&lon={lon}&appid={API_KEY}"),
+        )
+        cur, fc = orjson.loads(cur_res.content), orjson.loads(fc_res.content)
+
+        cur_list, fc_list = cur.get("list", []), fc.get("list", [])
+        current_trend = _aqi_records(cur_list)
+        forecast = _aqi_records(fc_list)
+
+        # Daily means over the forecast, first 7 days.
+        daily = {}
+        for row in forecast:
+            day = row["datetime"][:10]
+            total, count = daily.get(day, (0, 0))
+            daily[day] = (total + row["aqi"], count + 1)
+        forecast_7days = [
+            {"date": day, "aqi": total / count}
+            for day, (total, count) in sorted(daily.items())[:7]
+        ]
+
+        # 30‑day history — Parquet read is blocking, keep it off the event loop.
+        history = await asyncio.to_thread(read_city_history, city)
+
+        latest = cur_list[-1]["main"]["aqi"] if cur_list else None
+
+        # Cache hits are instant, but a miss is a ~1 s synchronous Gemini
+        # round trip — keep it off the event loop like the Parquet read.
+        advice = await asyncio.to_thread(generate_health_advice, city, latest)
 
         return {
             "city": city,
-            "current_trend": df_cur.to_dict("records"),
-            "forecast": df_fc.to_dict("records"),
-            "forecast_7days": df_7d.to_dict("records"),
-            "history": history.to_dict("records"),
-            "gemini_advice": generate_health_advice(city, latest)
+            "current_trend": current_trend,
+            "forecast": forecast,
+            "forecast_7days": forecast_7days,
+            "history": history,
+            "gemini_advice": advice
         }
     except Exception as e:
         print("❌ /aqi failed:", e)
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.get("/aqi_by_coords")
-def aqi_by_coords(lat: float = Query(...), lon: float = Query(...)):
+async def aqi_by_coords(lat: float = Query(...), lon: float = Query(...)):
     try:
-        aqi = get_aqi(lat, lon)
-        return {"lat": lat, "lon": lon, "aqi": aqi}
+        aqi = await get_aqi(lat, lon)
+        return {"lat": lat, "lon": lon, "aqi": aqi, "nearest_city": nearest_district(lat, lon)}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 # 👉 NEW: download CSV
 @app.get("/download_history")
 def download_history():
-    if os.path.exists(HISTORICAL_CSV):
-        return FileResponse(HISTORICAL_CSV, media_type="text/csv", filename=HISTORICAL_CSV)
-    return JSONResponse(status_code=404, content={"error": "History not found"})
+    if not os.path.isdir(HISTORY_DIR):
+        return JSONResponse(status_code=404, content={"error": "History not found"})
+    import pyarrow.csv as pacsv
+    from io import BytesIO
+    try:
+        table = pq.read_table(HISTORY_DIR).sort_by("date")
+    except Exception as e:
+        print("⚠️ History read failed:", e)
+        return JSONResponse(status_code=404, content={"error": "History not found"})
+    buf = BytesIO()
+    pacsv.write_csv(table, buf)
+    return Response(
+        buf.getvalue(), media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=aqi_history.csv"},
+    )
 
 # -------------------- Local entry --------------------
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=10000, reload=True)
+    uvicorn.run(
+        "main:app", host="0.0.0.0", port=10000,
+        loop="uvloop", http="httptools", workers=os.cpu_count(),
+    )